@@ -8,5 +8,5 @@
 from ._ellipsoid import Ellipsoid
 from ._realizations import GRS80, MARS, MERCURY, MOON, VENUS, VESTA, WGS84
 from ._sphere import Sphere
-from ._triaxialellipsoid import TriaxialEllipsoid
+from ._triaxialellipsoid import TriaxialEllipsoid, geocentric_radius_batch
 from ._version import __version__
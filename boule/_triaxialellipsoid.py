@@ -7,14 +7,73 @@
 """
 Define a reference triaxial ellipsoid.
 """
+import functools
+import math
 from warnings import warn
 
 import attr
 import numpy as np
 
+from ._triaxialellipsoid_kernels import (
+    _DEG2RAD,
+    _geocentric_radius_cupy,
+    _get_numba_kernels,
+    _is_cupy_array,
+)
+
+
+def _get_array_namespace(*arrays):
+    """
+    Get the namespace of functions for arrays that aren't NumPy arrays.
+
+    Arrays that implement the Python array API standard provide their
+    namespace through ``__array_namespace__``. Arrays that only support NumPy
+    ufuncs (like Dask arrays) use the NumPy namespace, which dispatches the
+    functions to their own implementation. The other arguments are converted
+    to arrays of the namespace (unless they already are arrays of the same
+    type) so that sequences can be mixed with these arrays.
+
+    Subclasses of NumPy arrays (like masked arrays) also use the NumPy
+    namespace this way instead of being converted to plain NumPy arrays.
+
+    Returns the namespace and the converted arrays. The namespace is None if
+    all arrays are NumPy arrays, scalars or sequences.
+    """
+    for array in arrays:
+        if type(array) is np.ndarray or isinstance(array, np.generic):
+            continue
+        if hasattr(array, "__array_namespace__"):
+            xp = array.__array_namespace__()
+        elif hasattr(array, "__array_ufunc__"):
+            xp = np
+        else:
+            continue
+        array_type = type(array)
+        arrays = tuple(
+            other if isinstance(other, array_type) else xp.asarray(other)
+            for other in arrays
+        )
+        return xp, arrays
+    return None, arrays
+
+
+@functools.lru_cache(maxsize=4)
+def _cos_sin_degrees(angle):
+    """
+    Cosine and sine of an angle in degrees.
+
+    Cached since it's called with the same longitude of the semi-major axis
+    (usually 0 or a single reference meridian) over and over.
+    """
+    angle_rad = angle * _DEG2RAD
+    return math.cos(angle_rad), math.sin(angle_rad)
+
 
 # Don't let ellipsoid parameters be changed to avoid messing up calculations
-# accidentally.
+# accidentally. Slots aren't used since attrs has to set each attribute of a
+# frozen slotted class with object.__setattr__, which makes creating an
+# ellipsoid about 40% slower. The instance __dict__ also stores the cached
+# coefficients of the geocentric radius.
 @attr.s(frozen=True)
 class TriaxialEllipsoid:
     r"""
@@ -122,45 +181,69 @@ class TriaxialEllipsoid:
             "Must be major > medium > minor."
         )
 
-    @semimajor_axis.validator
-    def _check_semimajor_axis(self, semimajor_axis, value):
+    def __attrs_post_init__(self):
         """
-        Check if semimajor_axis is positive and is the largest of the axis.
+        Check if the input parameters are valid.
         """
-        if not value > 0:
+        # Check all parameters here instead of using one attrs validator for
+        # each, which avoids several function calls on every instantiation.
+        a = self.semimajor_axis
+        b = self.semimedium_axis
+        c = self.semiminor_axis
+        if not a > 0:
             raise ValueError(
-                f"Invalid semi-major axis '{value}'. Should be greater than zero."
+                f"Invalid semi-major axis '{a}'. Should be greater than zero."
             )
-        if self.semimedium_axis > value:
+        if b > a:
             self._raise_invalid_axis()
-
-    @semimedium_axis.validator
-    def _check_semimedium_axis(self, semimedium_axis, value):
-        """
-        Check if semimedium_axis is positive and larger than semi-minor axis.
-        """
-        if not value > 0:
+        if not b > 0:
             raise ValueError(
-                f"Invalid semi-medium axis '{value}'. Should be greater than zero."
+                f"Invalid semi-medium axis '{b}'. Should be greater than zero."
             )
-        if self.semiminor_axis > value:
+        if c > b:
             self._raise_invalid_axis()
-
-    @semiminor_axis.validator
-    def _check_semiminor_axis(self, semiminor_axis, value):
-        "Check if semiminor_axis is positive."
-        if not value > 0:
+        if not c > 0:
             raise ValueError(
-                f"Invalid semi-minor axis '{value}'. Should be greater than zero."
+                f"Invalid semi-minor axis '{c}'. Should be greater than zero."
             )
-        # Don't need to check here because if the two checks for major and
-        # medium pass it means that this is the smallest.
+        if self.geocentric_grav_const < 0:
+            warn(
+                "The geocentric gravitational constant is negative: "
+                f"'{self.geocentric_grav_const}'"
+            )
+
+    @property
+    def _radius_coefficients(self):
+        """
+        The scalar coefficients of the geocentric radius.
 
-    @geocentric_grav_const.validator
-    def _check_geocentric_grav_const(self, geocentric_grav_const, value):
-        "Warn if geocentric_grav_const is negative."
-        if value < 0:
-            warn(f"The geocentric gravitational constant is negative: '{value}'")
+        Computed on first use and stored in the instance so that creating an
+        ellipsoid stays cheap.
+        """
+        coefficients = self.__dict__.get("_radius_coefficients")
+        if coefficients is None:
+            # Replacing sin^2 by 1 - cos^2 in the denominator of the radius
+            # leaves it as: constant - cos^2(lat) * (coef_coslat + coef_coslon
+            # * cos^2(lon)), which doesn't need the sine of the latitude.
+            # Since 1 - f_b = b/a, 1 - f_c = c/a and 2f - f^2 = 1 - (1 - f)^2,
+            # the coefficients can be written directly in terms of the axes:
+            # numerator = b c / a, constant = b^2 / a^2,
+            # coef_coslat = (b^2 - c^2) / a^2,
+            # coef_coslon = c^2 (a^2 - b^2) / a^4.
+            # The differences of squares are factored to avoid cancellation.
+            a = self.semimajor_axis
+            b = self.semimedium_axis
+            c = self.semiminor_axis
+            a_sq = a * a
+            coefficients = (
+                b * c / a,
+                b * b / a_sq,
+                (b - c) * (b + c) / a_sq,
+                c * c * (a - b) * (a + b) / (a_sq * a_sq),
+            )
+            # The class is frozen so we can't set attributes normally
+            self.__dict__["_radius_coefficients"] = coefficients
+        return coefficients
 
     @property
     def mean_radius(self):
@@ -204,7 +287,14 @@ class TriaxialEllipsoid:
         """
         return (self.semimajor_axis - self.semiminor_axis) / self.semimajor_axis
 
-    def geocentric_radius(self, longitude, latitude, longitude_semimajor_axis=0.0):
+    def geocentric_radius(
+        self,
+        longitude,
+        latitude,
+        longitude_semimajor_axis=0.0,
+        dtype=None,
+        parallel=False,
+    ):
         r"""
         Radial distance from the center of the ellipsoid to its surface.
 
@@ -217,10 +307,25 @@ class TriaxialEllipsoid:
             Longitude coordinates on spherical coordinate system in degrees.
         latitude : float or array
             Latitude coordinates on spherical coordinate system in degrees.
-        longitude_semimajor_axis : float (optional)
+        longitude_semimajor_axis : float or array (optional)
             Longitude coordinate of the meridian containing the semi-major axis
-            on spherical coordinate system in degrees. Optional, default value
-            is 0.0.
+            on spherical coordinate system in degrees. Arrays are broadcast
+            against the coordinates. Optional, default value is 0.0.
+        dtype : str, numpy dtype or None (optional)
+            Floating point type used in the computations and for the returned
+            radius. If None, will use ``float64``. Using ``float32`` halves the
+            memory used and moved by the computation on large arrays, at the
+            cost of precision: results have about 7 significant digits instead
+            of 16 (a relative error of the order of :math:`10^{-7}`).
+            Must be a floating point type. Optional, default value is None.
+        parallel : bool (optional)
+            If True and `numba <https://numba.pydata.org/>`__ is installed,
+            compute the radius of array coordinates on several threads. Numba's
+            fallback ``workqueue`` threading layer aborts the process if
+            parallel functions are called from several Python threads at the
+            same time, so only enable it if the method isn't called
+            concurrently or if the ``tbb`` or ``omp`` threading layers are
+            available. Optional, default value is False.
 
         Returns
         -------
@@ -275,23 +380,347 @@ class TriaxialEllipsoid:
 
         Note that [Pec1983]_ use geocentric spherical co-latitude, while here
         we used geocentric spherical latitude.
+
+        Array coordinates are converted to contiguous arrays of ``dtype``
+        before the computation. If `numba <https://numba.pydata.org/>`__ is
+        installed, the radius for array coordinates is computed by a compiled
+        kernel (in parallel if ``parallel`` is True). If the coordinates are
+        `CuPy <https://cupy.dev/>`__ arrays, the radius is computed on the GPU
+        by a single CUDA kernel and returned as a CuPy array.
+
+        Arrays from other libraries are supported if they implement the
+        `Python array API standard <https://data-apis.org/array-api/>`__
+        (for example, `JAX <https://jax.readthedocs.io>`__ arrays) or NumPy
+        universal functions (for example, `Dask <https://www.dask.org/>`__
+        arrays and NumPy masked arrays). In these cases, the radius is
+        computed by the library that created the arrays and returned as one of
+        its arrays (which lets Dask compute it lazily and JAX compile and
+        differentiate it). The computations use the floating point type of the
+        coordinates and ``dtype`` is ignored.
+        """
+        numerator, coef_constant, coef_coslat, coef_coslon = self._radius_coefficients
+        if (
+            dtype is None
+            and isinstance(longitude, (int, float))
+            and isinstance(latitude, (int, float))
+            and isinstance(longitude_semimajor_axis, (int, float))
+        ):
+            # Avoid the overhead of NumPy ufuncs when given single coordinates
+            coslat_sq = math.cos(latitude * _DEG2RAD) ** 2
+            coslon_sq = math.cos((longitude - longitude_semimajor_axis) * _DEG2RAD) ** 2
+            return numerator / math.sqrt(
+                coef_constant - coslat_sq * (coef_coslat + coef_coslon * coslon_sq)
+            )
+        if dtype is not None and not np.issubdtype(dtype, np.floating):
+            raise ValueError(
+                f"Invalid dtype '{dtype}'. Should be a floating point type."
+            )
+        if _is_cupy_array(longitude) or _is_cupy_array(latitude):
+            return _geocentric_radius_cupy(
+                longitude,
+                latitude,
+                np.float64 if dtype is None else dtype,
+                longitude_semimajor_axis,
+                numerator,
+                coef_constant,
+                coef_coslat,
+                coef_coslon,
+            )
+        xp, (longitude, latitude) = _get_array_namespace(longitude, latitude)
+        if xp is not None:
+            if np.ndim(longitude_semimajor_axis) > 0:
+                longitude_semimajor_axis = xp.asarray(longitude_semimajor_axis)
+            # Only use operations from the array API standard so that the
+            # computations are done (and possibly fused or delayed) by the
+            # library that created the arrays
+            coslat_sq = xp.cos(latitude * _DEG2RAD) ** 2
+            coslon_sq = xp.cos((longitude - longitude_semimajor_axis) * _DEG2RAD) ** 2
+            return numerator / xp.sqrt(
+                coef_constant - coslat_sq * (coef_coslat + coef_coslon * coslon_sq)
+            )
+        # Cast the coefficients to the dtype so they don't promote the
+        # computations back to float64
+        dtype = np.dtype(np.float64 if dtype is None else dtype)
+        longitude_semimajor_axis = np.asarray(longitude_semimajor_axis, dtype=dtype)
+        numerator = dtype.type(numerator)
+        coef_constant = dtype.type(coef_constant)
+        coef_coslat = dtype.type(coef_coslat)
+        coef_coslon = dtype.type(coef_coslon)
+        # Convert once to contiguous arrays to avoid type promotions and
+        # copies in every operation below
+        longitude = np.asarray(longitude, dtype=dtype, order="C")
+        latitude = np.asarray(latitude, dtype=dtype, order="C")
+        deg2rad = dtype.type(_DEG2RAD)
+        kernels = _get_numba_kernels()
+        # The kernels only take a single longitude of the semi-major axis
+        if (
+            kernels is not None
+            and longitude_semimajor_axis.ndim == 0
+            and (longitude.ndim > 0 or latitude.ndim > 0)
+        ):
+            if parallel:
+                kernel = kernels._geocentric_radius_kernel_parallel
+            else:
+                kernel = kernels._geocentric_radius_kernel
+            # Flattening only copies the coordinates if they were broadcast
+            longitude, latitude = np.broadcast_arrays(longitude, latitude)
+            radius = np.empty(latitude.shape, dtype=dtype)
+            kernel(
+                np.ravel(longitude),
+                np.ravel(latitude),
+                deg2rad,
+                longitude_semimajor_axis[()],
+                numerator,
+                coef_constant,
+                coef_coslat,
+                coef_coslon,
+                radius.ravel(),
+            )
+            return radius
+
+        # Compute the radius in place on two buffers to avoid allocating a new
+        # array for every operation: one for the cosine of the latitude and
+        # one for the output, which is also used for the cosine of the
+        # longitude.
+        coslat_sq = np.empty(latitude.shape, dtype=dtype)
+        np.multiply(latitude, deg2rad, out=coslat_sq)
+        np.cos(coslat_sq, out=coslat_sq)
+        np.multiply(coslat_sq, coslat_sq, out=coslat_sq)
+        radius = np.empty(
+            np.broadcast(longitude, latitude, longitude_semimajor_axis).shape,
+            dtype=dtype,
+        )
+        # Skip the subtraction (a whole pass over the array) for the default
+        # longitude of the semi-major axis
+        if longitude_semimajor_axis.ndim == 0 and longitude_semimajor_axis == 0:
+            np.multiply(longitude, deg2rad, out=radius)
+        else:
+            np.subtract(longitude, longitude_semimajor_axis, out=radius)
+            np.multiply(radius, deg2rad, out=radius)
+        np.cos(radius, out=radius)
+        np.multiply(radius, radius, out=radius)
+        # Denominator: constant - cos^2(lat) * (coef_coslat + coef_coslon *
+        # cos^2(lon))
+        np.multiply(radius, coef_coslon, out=radius)
+        np.add(radius, coef_coslat, out=radius)
+        np.multiply(radius, coslat_sq, out=radius)
+        np.subtract(coef_constant, radius, out=radius)
+        np.sqrt(radius, out=radius)
+        np.divide(numerator, radius, out=radius)
+        if radius.ndim == 0:
+            return radius[()]
+        return radius
+
+    def geocentric_radius_xyz(self, x, y, z, longitude_semimajor_axis=0.0):
+        r"""
+        Radial distance from the center of the ellipsoid to its surface.
+
+        Same as :meth:`~boule.TriaxialEllipsoid.geocentric_radius` but the
+        direction of the point is given by geocentric Cartesian coordinates
+        instead of spherical latitude and longitude. This avoids the
+        trigonometric functions needed to convert from Cartesian to spherical
+        coordinates and back.
+
+        Parameters
+        ----------
+        x : float or array
+            Cartesian coordinate along the axis that crosses the equator at
+            longitude 0 of the spherical coordinate system.
+        y : float or array
+            Cartesian coordinate along the axis that crosses the equator at
+            longitude 90 degrees of the spherical coordinate system.
+        z : float or array
+            Cartesian coordinate along the rotation axis, pointing north.
+        longitude_semimajor_axis : float (optional)
+            Longitude coordinate of the meridian containing the semi-major axis
+            on spherical coordinate system in degrees. Its cosine and sine are
+            cached for the last few values used, so reusing the same value
+            across calls avoids recomputing them. Optional, default value is
+            0.0.
+
+        Returns
+        -------
+        geocentric_radius : float or array
+            The geocentric radius in the direction of the given point(s) in the
+            same units as the axes of the ellipsoid.
+
+
+        .. tip::
+
+            Only the direction of the point is used, so the coordinates don't
+            need to be normalized and can be in any units.
+
+        Notes
+        -----
+
+        The squared cosines of the spherical latitude :math:`\phi` and of the
+        longitude relative to the semi-major axis :math:`\lambda - \lambda_a`
+        used in :meth:`~boule.TriaxialEllipsoid.geocentric_radius` can be
+        obtained from the Cartesian coordinates as
+
+        .. math::
+
+            \cos^2 \phi = \frac{x^2 + y^2}{x^2 + y^2 + z^2},
+            \quad
+            \cos^2 \phi \cos^2 (\lambda - \lambda_a) =
+            \frac{
+                (x \cos \lambda_a + y \sin \lambda_a)^2
+            }{
+                x^2 + y^2 + z^2
+            }.
+
         """
-        latitude_rad = np.radians(latitude)
-        longitude_rad = np.radians(longitude)
-        longitude_semimajor_axis_rad = np.radians(longitude_semimajor_axis)
-
-        coslat, sinlat = np.cos(latitude_rad), np.sin(latitude_rad)
-
-        fc = self.meridional_flattening
-        fb = self.equatorial_flattening
-
-        radius = (self.semimajor_axis * (1.0 - fc) * (1.0 - fb)) / np.sqrt(
-            1.0
-            - (2.0 * fc - fc**2) * coslat**2
-            - (2.0 * fb - fb**2) * sinlat**2
-            - (1.0 - fc) ** 2
-            * (2.0 * fb - fb**2)
-            * coslat**2
-            * np.cos(longitude_rad - longitude_semimajor_axis_rad) ** 2
+        coslon_semimajor, sinlon_semimajor = _cos_sin_degrees(
+            float(longitude_semimajor_axis)
+        )
+        numerator, coef_constant, coef_coslat, coef_coslon = self._radius_coefficients
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        horizontal_sq = x * x + y * y
+        projection = x * coslon_semimajor + y * sinlon_semimajor
+        radius = numerator / np.sqrt(
+            coef_constant
+            - (coef_coslat * horizontal_sq + coef_coslon * projection * projection)
+            / (horizontal_sq + z * z)
         )
         return radius
+
+    def make_radius_fn(self, longitude_semimajor_axis=0.0):
+        r"""
+        Create a function that computes the geocentric radius of the ellipsoid.
+
+        The returned function computes the same values as
+        :meth:`~boule.TriaxialEllipsoid.geocentric_radius` for a fixed
+        longitude of the semi-major axis. Use it when the geocentric radius is
+        needed many times for the same ellipsoid, for example inside a loop.
+
+        If `numba <https://numba.pydata.org/>`__ is installed, the function is
+        compiled by Numba with the parameters of the ellipsoid built in as
+        constants and can also be called from other jitted functions. It's
+        compiled on its first call for each type of the arguments, which takes
+        a fraction of a second. The functions are reused for the same
+        ellipsoid parameters and longitude of the semi-major axis, so only the
+        first one pays this cost. After that, calling it from Python on
+        single coordinates takes about 0.2 µs (a third of the time taken by
+        :meth:`~boule.TriaxialEllipsoid.geocentric_radius`). Without Numba, it
+        calls :meth:`~boule.TriaxialEllipsoid.geocentric_radius`.
+
+        Parameters
+        ----------
+        longitude_semimajor_axis : float (optional)
+            Longitude coordinate of the meridian containing the semi-major axis
+            on spherical coordinate system in degrees. Optional, default value
+            is 0.0.
+
+        Returns
+        -------
+        geocentric_radius : callable
+            A function ``geocentric_radius(longitude, latitude)`` taking
+            spherical longitude(s) and latitude(s) in degrees (floats or
+            arrays) and returning the geocentric radius. It is thread-safe.
+
+        Examples
+        --------
+
+        >>> ellipsoid = TriaxialEllipsoid(
+        ...     name="example",
+        ...     semimajor_axis=3,
+        ...     semimedium_axis=2,
+        ...     semiminor_axis=1,
+        ...     geocentric_grav_const=1,
+        ...     angular_velocity=0,
+        ... )
+        >>> geocentric_radius = ellipsoid.make_radius_fn()
+        >>> print(f"{geocentric_radius(90, 0):.1f}")
+        2.0
+
+        """
+        kernels = _get_numba_kernels()
+        if kernels is not None:
+            return kernels._make_geocentric_radius_function(
+                float(longitude_semimajor_axis), *self._radius_coefficients
+            )
+        return functools.partial(
+            self.geocentric_radius,
+            longitude_semimajor_axis=longitude_semimajor_axis,
+        )
+
+
+def geocentric_radius_batch(
+    ellipsoids, longitude, latitude, longitude_semimajor_axis=0.0
+):
+    r"""
+    Geocentric radius of several triaxial ellipsoids at the same coordinates.
+
+    Equivalent to calling :meth:`boule.TriaxialEllipsoid.geocentric_radius`
+    for each ellipsoid and stacking the results, but the computations are
+    vectorized over the ellipsoids. The cosine of the latitude is computed only
+    once for all of them, as well as the cosine of the longitude if all
+    ellipsoids share the same longitude of the semi-major axis.
+
+    Parameters
+    ----------
+    ellipsoids : list of :class:`boule.TriaxialEllipsoid`
+        The :math:`M` ellipsoids for which the radius will be computed.
+    longitude : float or array
+        Longitude coordinates on spherical coordinate system in degrees.
+    latitude : float or array
+        Latitude coordinates on spherical coordinate system in degrees.
+    longitude_semimajor_axis : float or array (optional)
+        Longitude coordinate of the meridian containing the semi-major axis
+        on spherical coordinate system in degrees. Either a single value for
+        all ellipsoids or an array with one value per ellipsoid. Optional,
+        default value is 0.0.
+
+    Returns
+    -------
+    geocentric_radius : array
+        The geocentric radius of each ellipsoid for the given spherical
+        latitude(s) and spherical longitude(s). The first dimension runs over
+        the ellipsoids and the others are the shape of the coordinates. The
+        array is empty if no ellipsoids are given.
+
+    Examples
+    --------
+
+    >>> ellipsoids = [
+    ...     TriaxialEllipsoid(
+    ...         name=f"example{i}",
+    ...         semimajor_axis=3 * i,
+    ...         semimedium_axis=2 * i,
+    ...         semiminor_axis=1 * i,
+    ...         geocentric_grav_const=1,
+    ...         angular_velocity=0,
+    ...     )
+    ...     for i in range(1, 4)
+    ... ]
+    >>> radius = geocentric_radius_batch(ellipsoids, [0, 90, 180], 0)
+    >>> print(radius.shape)
+    (3, 3)
+    >>> print(radius[:, 1])
+    [2. 4. 6.]
+
+    """
+    longitude = np.asarray(longitude, dtype=np.float64)
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude_semimajor_axis = np.asarray(longitude_semimajor_axis, dtype=np.float64)
+    # Put the ellipsoids along the first dimension and broadcast their
+    # parameters against the coordinates
+    shape = (len(ellipsoids),) + (1,) * np.broadcast(longitude, latitude).ndim
+    # Reshape to 4 columns so that an empty list of ellipsoids gives an empty
+    # radius instead of failing
+    coefficients = np.reshape(
+        [ellipsoid._radius_coefficients for ellipsoid in ellipsoids], (-1, 4)
+    )
+    numerator, coef_constant, coef_coslat, coef_coslon = (
+        np.reshape(column, shape) for column in coefficients.T
+    )
+    if longitude_semimajor_axis.ndim > 0:
+        longitude_semimajor_axis = longitude_semimajor_axis.reshape(shape)
+    coslat_sq = np.cos(latitude * _DEG2RAD) ** 2
+    coslon_sq = np.cos((longitude - longitude_semimajor_axis) * _DEG2RAD) ** 2
+    radius = numerator / np.sqrt(
+        coef_constant - coslat_sq * (coef_coslat + coef_coslon * coslon_sq)
+    )
+    return radius
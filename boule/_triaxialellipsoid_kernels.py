@@ -0,0 +1,107 @@
+# Copyright (c) 2019 The Boule Developers.
+# Distributed under the terms of the BSD 3-Clause License.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# This code is part of the Fatiando a Terra project (https://www.fatiando.org)
+#
+"""
+Compiled kernels for the computations of the triaxial ellipsoid.
+
+Numba and CuPy are optional dependencies and are only imported when needed. If
+Numba isn't installed, the NumPy implementations are used instead.
+"""
+import functools
+import math
+
+import numpy as np
+
+# Conversion factor from degrees to radians
+_DEG2RAD = math.pi / 180.0
+
+
+@functools.lru_cache(maxsize=None)
+def _get_numba_kernels():
+    """
+    Import the module with the Numba kernels or return None if Numba isn't
+    installed.
+
+    Numba is only imported on the first call (and not when importing Boule)
+    since importing it takes a long time.
+    """
+    from . import _triaxialellipsoid_numba
+
+    if _triaxialellipsoid_numba.numba is None:
+        return None
+    return _triaxialellipsoid_numba
+
+
+def _is_cupy_array(array):
+    """
+    Check if the given object is a CuPy array without importing CuPy.
+    """
+    return type(array).__module__.startswith("cupy")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_geocentric_radius_cupy_kernel():
+    """
+    Create a CuPy elementwise kernel that computes the geocentric radius.
+
+    The kernel takes the coordinates in degrees and the coefficients
+    pre-computed by TriaxialEllipsoid. It's created only once and compiled by
+    CuPy on the first call for each data type.
+    """
+    import cupy
+
+    return cupy.ElementwiseKernel(
+        "T longitude, T latitude, T longitude_semimajor_axis, T numerator, "
+        "T coef_constant, T coef_coslat, T coef_coslon",
+        "T radius",
+        f"""
+        const T deg2rad = {_DEG2RAD!r};
+        T coslat = cos(latitude * deg2rad);
+        T coslon = cos((longitude - longitude_semimajor_axis) * deg2rad);
+        radius = numerator * rsqrt(
+            coef_constant
+            - coslat * coslat * (coef_coslat + coef_coslon * coslon * coslon)
+        );
+        """,
+        "boule_triaxial_geocentric_radius",
+    )
+
+
+def _geocentric_radius_cupy(
+    longitude,
+    latitude,
+    dtype,
+    longitude_semimajor_axis,
+    numerator,
+    coef_constant,
+    coef_coslat,
+    coef_coslon,
+):
+    """
+    Compute the geocentric radius on the GPU for coordinates in degrees.
+
+    The coordinates are converted to CuPy arrays of the given dtype, which
+    allows one of them to be a NumPy array or a scalar. The scalars are cast
+    to the same dtype. The longitude of the semi-major axis can also be an
+    array, which is broadcast against the coordinates by the kernel.
+    """
+    import cupy
+
+    dtype = cupy.dtype(dtype)
+    if np.ndim(longitude_semimajor_axis) > 0:
+        longitude_semimajor_axis = cupy.asarray(longitude_semimajor_axis, dtype=dtype)
+    else:
+        longitude_semimajor_axis = dtype.type(longitude_semimajor_axis)
+    kernel = _get_geocentric_radius_cupy_kernel()
+    return kernel(
+        cupy.asarray(longitude, dtype=dtype),
+        cupy.asarray(latitude, dtype=dtype),
+        longitude_semimajor_axis,
+        dtype.type(numerator),
+        dtype.type(coef_constant),
+        dtype.type(coef_coslat),
+        dtype.type(coef_coslon),
+    )
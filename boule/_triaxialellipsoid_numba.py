@@ -0,0 +1,151 @@
+# Copyright (c) 2019 The Boule Developers.
+# Distributed under the terms of the BSD 3-Clause License.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# This code is part of the Fatiando a Terra project (https://www.fatiando.org)
+#
+"""
+Numba kernels for the computations of the triaxial ellipsoid.
+
+This module is imported lazily by _get_numba_kernels so that importing Boule
+doesn't import Numba. If Numba isn't installed, the kernels aren't defined.
+"""
+import functools
+import math
+
+import numpy as np
+
+from ._triaxialellipsoid_kernels import _DEG2RAD
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Fast-math flags for the kernels. Leave out "nnan" and "ninf" since NaNs are
+# commonly used to mark missing coordinates and must be propagated.
+_FASTMATH = {"contract", "afn", "arcp", "reassoc"}
+
+
+if numba is not None:
+
+    @numba.njit(fastmath=_FASTMATH, error_model="numpy", inline="always")
+    def _geocentric_radius_point(
+        longitude,
+        latitude,
+        deg2rad,
+        longitude_semimajor_axis,
+        numerator,
+        coef_constant,
+        coef_coslat,
+        coef_coslon,
+    ):
+        """
+        Compute the geocentric radius of a single point given in degrees.
+        """
+        coslat = math.cos(latitude * deg2rad)
+        coslon = math.cos((longitude - longitude_semimajor_axis) * deg2rad)
+        # Multiply by the reciprocal square root instead of dividing by the
+        # square root, which fastmath can turn into a faster approximation
+        # refined by a Newton step
+        return numerator * (
+            coef_constant
+            - coslat * coslat * (coef_coslat + coef_coslon * coslon * coslon)
+        ) ** (-0.5)
+
+    # Use the NumPy error model so that the division doesn't need to check for
+    # zeros, which would prevent the loop from being vectorized. Cache the
+    # compiled code to avoid the compilation overhead in every new session.
+    @numba.njit(fastmath=_FASTMATH, error_model="numpy", cache=True)
+    def _geocentric_radius_kernel(
+        longitude,
+        latitude,
+        deg2rad,
+        longitude_semimajor_axis,
+        numerator,
+        coef_constant,
+        coef_coslat,
+        coef_coslon,
+        out,
+    ):
+        """
+        Compute the geocentric radius on 1D arrays of coordinates in degrees.
+
+        The scalar coefficients are the ones pre-computed by
+        TriaxialEllipsoid. The result is stored in ``out``, which must have
+        the same size as the coordinates.
+        """
+        for i in range(out.size):
+            out[i] = _geocentric_radius_point(
+                longitude[i],
+                latitude[i],
+                deg2rad,
+                longitude_semimajor_axis,
+                numerator,
+                coef_constant,
+                coef_coslat,
+                coef_coslon,
+            )
+
+    # Same as _geocentric_radius_kernel but the loop runs in parallel. Kept
+    # separate since Numba's workqueue threading layer aborts if a parallel
+    # function is called from several Python threads at the same time.
+    @numba.njit(parallel=True, fastmath=_FASTMATH, error_model="numpy", cache=True)
+    def _geocentric_radius_kernel_parallel(
+        longitude,
+        latitude,
+        deg2rad,
+        longitude_semimajor_axis,
+        numerator,
+        coef_constant,
+        coef_coslat,
+        coef_coslon,
+        out,
+    ):
+        """
+        Compute the geocentric radius on 1D arrays of coordinates in degrees
+        in parallel.
+        """
+        for i in numba.prange(out.size):
+            out[i] = _geocentric_radius_point(
+                longitude[i],
+                latitude[i],
+                deg2rad,
+                longitude_semimajor_axis,
+                numerator,
+                coef_constant,
+                coef_coslat,
+                coef_coslon,
+            )
+
+    # Memoize the compiled functions since every new function is compiled
+    # again on its first call
+    @functools.lru_cache(maxsize=32)
+    def _make_geocentric_radius_function(
+        longitude_semimajor_axis,
+        numerator,
+        coef_constant,
+        coef_coslat,
+        coef_coslon,
+    ):
+        """
+        Create a jitted function computing the geocentric radius from
+        coordinates in degrees.
+
+        The scalar arguments are captured by the closure and compiled as
+        constants, which allows LLVM to fold them into the generated code.
+        NumPy functions are used instead of the math module so that the
+        function also takes arrays.
+        """
+
+        @numba.njit(fastmath=_FASTMATH, error_model="numpy")
+        def geocentric_radius(longitude, latitude):
+            coslat = np.cos(latitude * _DEG2RAD)
+            coslon = np.cos((longitude - longitude_semimajor_axis) * _DEG2RAD)
+            return numerator * (
+                coef_constant
+                - coslat * coslat * (coef_coslat + coef_coslon * coslon * coslon)
+            ) ** (-0.5)
+
+        return geocentric_radius
@@ -8,12 +8,14 @@
 Test the base TriaxialEllipsoid class.
 """
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 
+import attr
 import numpy as np
 import numpy.testing as npt
 import pytest
 
-from .. import Ellipsoid, TriaxialEllipsoid
+from .. import Ellipsoid, TriaxialEllipsoid, _triaxialellipsoid, geocentric_radius_batch
 
 
 @pytest.fixture
@@ -30,6 +32,15 @@ def triaxialellipsoid():
     return triaxial_ellipsoid
 
 
+@pytest.fixture
+def coordinates():
+    "A regular grid of longitude and latitude coordinates in degrees"
+    longitude, latitude = np.meshgrid(
+        np.linspace(0.0, 360.0, 37), np.linspace(-90.0, 90.0, 19)
+    )
+    return longitude, latitude
+
+
 def test_check_semimajor():
     """
     Check if error is raised after invalid semimajor axis
@@ -280,3 +291,353 @@ def test_geocentric_radius_biaxialellipsoid(triaxialellipsoid):
     npt.assert_allclose(
         radius_true, biaxialellipsoid.geocentric_radius(longitude, latitude)
     )
+
+
+def test_geocentric_radius_numpy_fallback(triaxialellipsoid, monkeypatch, coordinates):
+    """
+    Check that the NumPy implementation matches the compiled kernel
+    """
+    pytest.importorskip("numba")
+    longitude, latitude = coordinates
+    radius = triaxialellipsoid.geocentric_radius(longitude, latitude, 30.0)
+    monkeypatch.setattr(_triaxialellipsoid, "_get_numba_kernels", lambda: None)
+    npt.assert_allclose(
+        radius, triaxialellipsoid.geocentric_radius(longitude, latitude, 30.0)
+    )
+
+
+def test_geocentric_radius_parallel(triaxialellipsoid, coordinates):
+    """
+    Check that the parallel kernel matches the serial one
+    """
+    pytest.importorskip("numba")
+    longitude, latitude = coordinates
+    npt.assert_allclose(
+        triaxialellipsoid.geocentric_radius(longitude, latitude, 30.0),
+        triaxialellipsoid.geocentric_radius(longitude, latitude, 30.0, parallel=True),
+    )
+
+
+def test_geocentric_radius_threads(triaxialellipsoid, coordinates):
+    """
+    Check that the radius can be computed from several threads at once
+    """
+    longitude, latitude = coordinates
+    radius = triaxialellipsoid.geocentric_radius(longitude, latitude, 30.0)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(
+                lambda _: triaxialellipsoid.geocentric_radius(
+                    longitude, latitude, 30.0
+                ),
+                range(16),
+            )
+        )
+    for result in results:
+        npt.assert_allclose(radius, result)
+
+
+def test_geocentric_radius_scalar(triaxialellipsoid):
+    """
+    Check that single coordinates give the same result as arrays
+    """
+    longitude = np.array([0, 30.0, 45.0, 90.0, 200.0])
+    latitude = np.array([0, -60.0, 15.0, 90.0, 33.0])
+    radius = triaxialellipsoid.geocentric_radius(longitude, latitude, 10.0)
+    for lon, lat, rad in zip(longitude.tolist(), latitude.tolist(), radius):
+        npt.assert_allclose(rad, triaxialellipsoid.geocentric_radius(lon, lat, 10.0))
+
+
+def test_geocentric_radius_integer_coordinates(triaxialellipsoid):
+    """
+    Check that integer coordinates give the same result as float ones
+    """
+    longitude = np.array([0, 30, 45, 90, 200])
+    latitude = np.array([0, -60, 15, 90, 33])
+    npt.assert_allclose(
+        triaxialellipsoid.geocentric_radius(longitude, latitude, 10),
+        triaxialellipsoid.geocentric_radius(
+            longitude.astype("float64"), latitude.astype("float64"), 10.0
+        ),
+    )
+
+
+@pytest.mark.parametrize("longitude_semimajor_axis", [0.0, 35.0])
+def test_geocentric_radius_xyz(
+    triaxialellipsoid, longitude_semimajor_axis, coordinates
+):
+    """
+    Check that Cartesian coordinates give the same radius as spherical ones
+    """
+    longitude, latitude = coordinates
+    # Use a distance other than 1 to check that only the direction matters
+    distance = 3.5
+    x = distance * np.cos(np.radians(latitude)) * np.cos(np.radians(longitude))
+    y = distance * np.cos(np.radians(latitude)) * np.sin(np.radians(longitude))
+    z = distance * np.sin(np.radians(latitude))
+    npt.assert_allclose(
+        triaxialellipsoid.geocentric_radius(
+            longitude, latitude, longitude_semimajor_axis
+        ),
+        triaxialellipsoid.geocentric_radius_xyz(x, y, z, longitude_semimajor_axis),
+    )
+
+
+@pytest.mark.parametrize("numba", [True, False])
+@pytest.mark.parametrize("longitude_semimajor_axis", [0.0, 35.0])
+def test_make_radius_fn(
+    triaxialellipsoid, longitude_semimajor_axis, numba, monkeypatch, coordinates
+):
+    """
+    Check that the specialized function matches geocentric_radius
+    """
+    if numba:
+        pytest.importorskip("numba")
+    else:
+        monkeypatch.setattr(_triaxialellipsoid, "_get_numba_kernels", lambda: None)
+    longitude, latitude = coordinates
+    geocentric_radius = triaxialellipsoid.make_radius_fn(longitude_semimajor_axis)
+    npt.assert_allclose(
+        triaxialellipsoid.geocentric_radius(
+            longitude, latitude, longitude_semimajor_axis
+        ),
+        geocentric_radius(longitude, latitude),
+    )
+    npt.assert_allclose(
+        triaxialellipsoid.geocentric_radius(30.0, 60.0, longitude_semimajor_axis),
+        geocentric_radius(30.0, 60.0),
+    )
+    assert np.isnan(geocentric_radius(np.nan, 60.0))
+
+
+def test_make_radius_fn_reused(triaxialellipsoid):
+    """
+    Check that the compiled function is reused and can be called from jitted
+    code
+    """
+    numba = pytest.importorskip("numba")
+    geocentric_radius = triaxialellipsoid.make_radius_fn(20.0)
+    assert triaxialellipsoid.make_radius_fn(20.0) is geocentric_radius
+
+    @numba.njit
+    def call(longitude, latitude):
+        return geocentric_radius(longitude, latitude)
+
+    npt.assert_allclose(
+        call(30.0, 60.0), triaxialellipsoid.geocentric_radius(30.0, 60.0, 20.0)
+    )
+
+
+def test_geocentric_radius_broadcast(triaxialellipsoid, monkeypatch):
+    """
+    Check that coordinates of different shapes are broadcast
+    """
+    longitude = np.linspace(0.0, 360.0, 37)
+    latitude = np.linspace(-90.0, 90.0, 19)
+    radius = triaxialellipsoid.geocentric_radius(
+        *np.meshgrid(longitude, latitude), 30.0
+    )
+    npt.assert_allclose(
+        radius,
+        triaxialellipsoid.geocentric_radius(longitude, latitude[:, np.newaxis], 30.0),
+    )
+    monkeypatch.setattr(_triaxialellipsoid, "_get_numba_kernels", lambda: None)
+    npt.assert_allclose(
+        radius,
+        triaxialellipsoid.geocentric_radius(longitude, latitude[:, np.newaxis], 30.0),
+    )
+
+
+@pytest.mark.parametrize("numba", [True, False])
+def test_geocentric_radius_longitude_semimajor_axis_array(
+    triaxialellipsoid, numba, monkeypatch
+):
+    """
+    Check that an array of longitudes of the semi-major axis is broadcast
+    """
+    if not numba:
+        monkeypatch.setattr(_triaxialellipsoid, "_get_numba_kernels", lambda: None)
+    longitude_semimajor_axis = np.array([0.0, 10.0])
+    for longitude, latitude in [(30.0, 40.0), (np.array([30.0, 50.0]), 40.0)]:
+        radius = triaxialellipsoid.geocentric_radius(
+            longitude, latitude, longitude_semimajor_axis
+        )
+        assert radius.shape == (2,)
+        longitude = np.broadcast_to(longitude, 2)
+        for i in range(2):
+            npt.assert_allclose(
+                radius[i],
+                triaxialellipsoid.geocentric_radius(
+                    float(longitude[i]), latitude, float(longitude_semimajor_axis[i])
+                ),
+            )
+    dask = pytest.importorskip("dask.array")
+    radius = triaxialellipsoid.geocentric_radius(
+        dask.asarray([30.0, 50.0]), 40.0, longitude_semimajor_axis
+    )
+    npt.assert_allclose(
+        np.asarray(radius),
+        triaxialellipsoid.geocentric_radius(
+            np.array([30.0, 50.0]), 40.0, longitude_semimajor_axis
+        ),
+    )
+
+
+@pytest.mark.parametrize("longitude_semimajor_axis", [0.0, [0.0, 35.0, -10.0]])
+def test_geocentric_radius_batch(triaxialellipsoid, longitude_semimajor_axis):
+    """
+    Check the batch computation against each ellipsoid individually
+    """
+    ellipsoids = [
+        triaxialellipsoid,
+        TriaxialEllipsoid("second", 5, 4, 3, 1, 0),
+        TriaxialEllipsoid("biaxial", 5, 5, 2, 1, 0),
+    ]
+    longitude = np.linspace(0.0, 360.0, 37)
+    latitude = np.linspace(-90.0, 90.0, 19)[:, np.newaxis]
+    radius = geocentric_radius_batch(
+        ellipsoids, longitude, latitude, longitude_semimajor_axis
+    )
+    assert radius.shape == (3, 19, 37)
+    longitude_semimajor_axis = np.broadcast_to(longitude_semimajor_axis, 3)
+    for i, ellipsoid in enumerate(ellipsoids):
+        npt.assert_allclose(
+            radius[i],
+            ellipsoid.geocentric_radius(
+                longitude, latitude, longitude_semimajor_axis[i]
+            ),
+        )
+
+
+def test_geocentric_radius_batch_empty():
+    """
+    Check that an empty list of ellipsoids gives an empty radius
+    """
+    longitude = np.linspace(0.0, 360.0, 37)
+    latitude = np.linspace(-90.0, 90.0, 19)[:, np.newaxis]
+    radius = geocentric_radius_batch([], longitude, latitude)
+    assert radius.shape == (0, 19, 37)
+
+
+@pytest.mark.parametrize("numba", [True, False])
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_geocentric_radius_dtype(
+    triaxialellipsoid, dtype, numba, monkeypatch, coordinates
+):
+    """
+    Check that the radius is computed and returned in the given dtype
+    """
+    if numba:
+        pytest.importorskip("numba")
+    else:
+        monkeypatch.setattr(_triaxialellipsoid, "_get_numba_kernels", lambda: None)
+    longitude, latitude = coordinates
+    radius = triaxialellipsoid.geocentric_radius(longitude, latitude, 30.0, dtype=dtype)
+    assert radius.dtype == np.dtype(dtype)
+    npt.assert_allclose(
+        radius,
+        triaxialellipsoid.geocentric_radius(longitude, latitude, 30.0),
+        rtol=1e-6,
+    )
+    radius = triaxialellipsoid.geocentric_radius(30.0, 40.0, dtype=dtype)
+    assert radius.dtype == np.dtype(dtype)
+
+
+@pytest.mark.parametrize("dtype", [int, "int32", bool, "complex128"])
+def test_geocentric_radius_invalid_dtype(triaxialellipsoid, dtype, coordinates):
+    """
+    Check that non floating point dtypes are rejected
+    """
+    longitude, latitude = coordinates
+    with pytest.raises(ValueError, match="Invalid dtype"):
+        triaxialellipsoid.geocentric_radius(longitude, latitude, dtype=dtype)
+    with pytest.raises(ValueError, match="Invalid dtype"):
+        triaxialellipsoid.geocentric_radius(30.0, 40.0, dtype=dtype)
+
+
+def test_geocentric_radius_cupy(triaxialellipsoid, coordinates):
+    """
+    Check that CuPy arrays give the same results as NumPy arrays
+    """
+    cupy = pytest.importorskip("cupy")
+    longitude, latitude = coordinates
+    radius = triaxialellipsoid.geocentric_radius(
+        cupy.asarray(longitude), cupy.asarray(latitude), 30.0
+    )
+    assert isinstance(radius, cupy.ndarray)
+    npt.assert_allclose(
+        triaxialellipsoid.geocentric_radius(longitude, latitude, 30.0),
+        cupy.asnumpy(radius),
+    )
+
+
+@pytest.mark.parametrize("library", ["array_api_strict", "dask.array"])
+def test_geocentric_radius_other_arrays(triaxialellipsoid, library, coordinates):
+    """
+    Check that arrays from other libraries give the same results as NumPy
+    """
+    xp = pytest.importorskip(library)
+    longitude, latitude = coordinates
+    radius = triaxialellipsoid.geocentric_radius(
+        xp.asarray(longitude), xp.asarray(latitude), 30.0
+    )
+    assert type(radius).__module__.startswith(library.split(".")[0])
+    npt.assert_allclose(
+        triaxialellipsoid.geocentric_radius(longitude, latitude, 30.0),
+        np.asarray(radius),
+    )
+
+
+def test_attrs_fields(triaxialellipsoid):
+    """
+    Check that internal attributes aren't part of the attrs fields
+    """
+    assert list(attr.asdict(triaxialellipsoid)) == [
+        "name",
+        "semimajor_axis",
+        "semimedium_axis",
+        "semiminor_axis",
+        "geocentric_grav_const",
+        "angular_velocity",
+        "long_name",
+        "reference",
+    ]
+
+
+@pytest.mark.parametrize("library", ["array_api_strict", "dask.array"])
+def test_geocentric_radius_other_arrays_mixed(triaxialellipsoid, library):
+    """
+    Check that arrays from other libraries can be mixed with lists
+    """
+    xp = pytest.importorskip(library)
+    longitude = [10.0, 20.0]
+    latitude = [3.0, 4.0]
+    radius = triaxialellipsoid.geocentric_radius(xp.asarray(longitude), latitude)
+    npt.assert_allclose(
+        triaxialellipsoid.geocentric_radius(np.array(longitude), np.array(latitude)),
+        np.asarray(radius),
+    )
+
+
+def test_geocentric_radius_masked_array(triaxialellipsoid):
+    """
+    Check that masked coordinates give a masked radius
+    """
+    latitude = np.ma.masked_array([1.0, 2.0], mask=[0, 1])
+    longitude = np.array([10.0, 20.0])
+    radius = triaxialellipsoid.geocentric_radius(longitude, latitude)
+    assert isinstance(radius, np.ma.MaskedArray)
+    npt.assert_array_equal(radius.mask, [False, True])
+    npt.assert_allclose(
+        radius[0], triaxialellipsoid.geocentric_radius(longitude[0], latitude[0])
+    )
+
+
+def test_geocentric_radius_nan(triaxialellipsoid):
+    """
+    Check that NaN coordinates give a NaN radius
+    """
+    longitude = np.array([0.0, np.nan, 30.0])
+    latitude = np.array([np.nan, 10.0, 20.0])
+    radius = triaxialellipsoid.geocentric_radius(longitude, latitude)
+    npt.assert_array_equal(np.isnan(radius), [True, True, False])